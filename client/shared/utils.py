@@ -2004,6 +2004,9 @@ def get_relative_path(path, reference):
     return os.path.join(*path_list)
 
 
+_SH_SPECIAL_CHARS_RE = re.compile(r'[\\$"`]')
+
+
 def sh_escape(command):
     """
     Escape special characters from a command so that it can be passed
@@ -2019,6 +2022,10 @@ def sh_escape(command):
 
     See also: http://www.tldp.org/LDP/abs/html/escapingsection.html
     """
+    # most commands and arguments have nothing to escape, one scan for the
+    # special characters is cheaper than the four replace() calls below
+    if _SH_SPECIAL_CHARS_RE.search(command) is None:
+        return command
     command = command.replace("\\", "\\\\")
     command = command.replace("$", r'\$')
     command = command.replace('"', r'\"')
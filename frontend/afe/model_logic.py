@@ -387,39 +387,46 @@ class ExtendedManager(dbmodels.Manager):
         raise ValueError('%s has no relation to %s' %
                          (related_model, self.model))
 
-    def _get_pivot_iterator(self, base_objects_by_id, related_model):
+    def _get_pivot_iterator(self, base_objects_by_id, related_model,
+                            select_related=()):
         """
         Determine the relationship between this model and related_model, and
         return a pivot iterator.
         :param base_objects_by_id: dict of instances of this model indexed by
         their IDs
+        :param select_related: foreign keys of related_model to fetch along
+        with the related objects
         :return: a pivot iterator, which yields a tuple (base_object,
         related_object) for each relationship between a base object and a
         related object.  all base_object instances come from base_objects_by_id.
         Note -- this depends on Django model internals.
         """
         relationship_type, field = self.determine_relationship(related_model)
+        related_query = related_model.objects.all()
+        if select_related:
+            related_query = related_query.select_related(*select_related)
         if relationship_type == self.MANY_TO_ONE:
             return self._many_to_one_pivot(base_objects_by_id,
-                                           related_model, field)
+                                           related_query, field)
         elif relationship_type == self.M2M_ON_RELATED_MODEL:
             return self._many_to_many_pivot(
-                base_objects_by_id, related_model, field.m2m_db_table(),
+                base_objects_by_id, related_query, field.m2m_db_table(),
                 field.m2m_reverse_name(), field.m2m_column_name())
         else:
             assert relationship_type == self.M2M_ON_THIS_MODEL
             return self._many_to_many_pivot(
-                base_objects_by_id, related_model, field.m2m_db_table(),
+                base_objects_by_id, related_query, field.m2m_db_table(),
                 field.m2m_column_name(), field.m2m_reverse_name())
 
-    def _many_to_one_pivot(self, base_objects_by_id, related_model,
+    def _many_to_one_pivot(self, base_objects_by_id, related_query,
                            foreign_key_field):
         """
+        :param related_query: query over the related model
         :return: a pivot iterator - see _get_pivot_iterator()
         """
         filter_data = {foreign_key_field.name + '__pk__in':
                        base_objects_by_id.keys()}
-        for related_object in related_model.objects.filter(**filter_data):
+        for related_object in related_query.filter(**filter_data):
             # lookup base object in the dict, rather than grabbing it from the
             # related object.  we need to return instances from the dict, not
             # fresh instances of the same models (and grabbing model instances
@@ -452,9 +459,10 @@ class ExtendedManager(dbmodels.Manager):
         cursor.execute(query)
         return cursor.fetchall()
 
-    def _many_to_many_pivot(self, base_objects_by_id, related_model,
+    def _many_to_many_pivot(self, base_objects_by_id, related_query,
                             pivot_table, pivot_from_field, pivot_to_field):
         """
+        :param related_query: query over the related model
         :param pivot_table: see _query_pivot_table
         :param pivot_from_field: see _query_pivot_table
         :param pivot_to_field: see _query_pivot_table
@@ -465,13 +473,13 @@ class ExtendedManager(dbmodels.Manager):
 
         all_related_ids = list(set(related_id for base_id, related_id
                                    in id_pivot))
-        related_objects_by_id = related_model.objects.in_bulk(all_related_ids)
+        related_objects_by_id = related_query.in_bulk(all_related_ids)
 
         for base_id, related_id in id_pivot:
             yield base_objects_by_id[base_id], related_objects_by_id[related_id]
 
     def populate_relationships(self, base_objects, related_model,
-                               related_list_name):
+                               related_list_name, select_related=()):
         """
         For each instance of this model in base_objects, add a field named
         related_list_name listing all the related objects of type related_model.
@@ -481,6 +489,8 @@ class ExtendedManager(dbmodels.Manager):
         :param related_model - model class related to this model
         :param related_list_name - attribute name in which to store the related
         object list.
+        :param select_related - names of foreign keys on related_model to fetch
+        in the same query as the related objects.
         """
         if not base_objects:
             # if we don't bail early, we'll get a SQL error later
@@ -489,7 +499,8 @@ class ExtendedManager(dbmodels.Manager):
         base_objects_by_id = dict((base_object._get_pk_val(), base_object)
                                   for base_object in base_objects)
         pivot_iterator = self._get_pivot_iterator(base_objects_by_id,
-                                                  related_model)
+                                                  related_model,
+                                                  select_related)
 
         for base_object in base_objects:
             setattr(base_object, related_list_name, [])
@@ -326,8 +326,11 @@ def get_hosts(multiple_labels=(), exclude_only_if_needed_labels=False,
                                      exclude_atomic_group_hosts,
                                      valid_only, filter_data)
     hosts = list(hosts)
+    # find_platform_and_atomic_group() looks at the atomic group of every
+    # label, fetch them together with the labels
     models.Host.objects.populate_relationships(hosts, models.Label,
-                                               'label_list')
+                                               'label_list',
+                                               select_related=['atomic_group'])
     models.Host.objects.populate_relationships(hosts, models.AclGroup,
                                                'acl_list')
     models.Host.objects.populate_relationships(hosts, models.HostAttribute,
@@ -1166,8 +1169,16 @@ def get_host_queue_entries_and_special_tasks(hostname, query_start=None,
                    'query_limit': total_limit,
                    'sort_by': ['-id']}
 
-    queue_entries = list(models.HostQueueEntry.query_objects(filter_data))
-    special_tasks = list(models.SpecialTask.query_objects(filter_data))
+    # interleave_entries() serializes the host and job of every entry and
+    # task, fetch them in the same queries
+    queue_entries = list(models.HostQueueEntry.query_objects(
+        filter_data,
+        initial_query=models.HostQueueEntry.objects.select_related('host',
+                                                                   'job')))
+    special_tasks = list(models.SpecialTask.query_objects(
+        filter_data,
+        initial_query=models.SpecialTask.objects.select_related(
+            'host', 'queue_entry__job')))
 
     interleaved_entries = rpc_utils.interleave_entries(queue_entries,
                                                        special_tasks)
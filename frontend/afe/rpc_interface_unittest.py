@@ -11,19 +11,13 @@ from autotest.frontend import test_utils
 from autotest.frontend.afe import models, rpc_interface
 from autotest.frontend.afe import model_logic, model_attributes
 from autotest.client.shared import settings
+from django.db import connection, transaction
 
 
 _hqe_status = models.HostQueueEntry.Status
 
 
-class RpcInterfaceTest(unittest.TestCase,
-                       test_utils.FrontendTestMixin):
-
-    def setUp(self):
-        self._frontend_common_setup()
-
-    def tearDown(self):
-        self._frontend_common_teardown()
+class RpcInterfaceTest(test_utils.FrontendClassTestCase):
 
     def test_validation(self):
         # non-number for a numeric field
@@ -51,12 +45,12 @@ class RpcInterfaceTest(unittest.TestCase,
         self.assertEquals(platforms[0]['name'], 'myplatform')
 
     def _check_hostnames(self, hosts, expected_hostnames):
-        self.assertEquals(set(host['hostname'] for host in hosts),
-                          set(expected_hostnames))
+        self.assertEquals(sorted(host['hostname'] for host in hosts),
+                          sorted(expected_hostnames))
 
     def test_get_hosts(self):
         hosts = rpc_interface.get_hosts()
-        self._check_hostnames(hosts, [host.hostname for host in self.hosts])
+        self._check_hostnames(hosts, self._all_hostnames)
 
         hosts = rpc_interface.get_hosts(hostname='host1')
         self._check_hostnames(hosts, ['host1'])
@@ -67,6 +61,12 @@ class RpcInterfaceTest(unittest.TestCase,
         self.assertEquals(host['acls'], ['my_acl'])
         self.assertEquals(host['attributes'], {})
 
+    def test_get_hosts_atomic_group(self):
+        hosts = rpc_interface.get_hosts(hostname__in=['host4', 'host5'])
+        atomic_groups = dict((host['hostname'], host['atomic_group'])
+                             for host in hosts)
+        self.assertEquals(atomic_groups, {'host4': None, 'host5': 'atomic1'})
+
     def test_get_hosts_multiple_labels(self):
         hosts = rpc_interface.get_hosts(
             multiple_labels=['myplatform', 'label1'])
@@ -106,14 +106,34 @@ class RpcInterfaceTest(unittest.TestCase,
         self.assertEquals(len(jobs), 1)
         self.assertEquals(jobs[0]['keyvals'], keyval_dict)
 
+    def _create_job_with_entries(self, entries):
+        """
+        Create a job with queue entries already in the given states.
+
+        Unlike _create_job(), this inserts all the entries at once and creates
+        no IneligibleHostQueue rows, for tests that only look at the entries.
+
+        :param entries: list of (host id, status, aborted) tuples, one per
+                queue entry.
+        """
+        job = models.Job.objects.create(
+            name='test', owner='autotest_system', priority=0,
+            created_on=datetime.datetime(2008, 1, 1), control_file='control')
+        queue_entries = []
+        for host_id, status, aborted in entries:
+            entry = models.HostQueueEntry(job=job, host_id=host_id,
+                                          status=status, aborted=aborted)
+            # bulk_create() doesn't go through save(), which sets these
+            entry._set_active_and_complete()
+            queue_entries.append(entry)
+        models.HostQueueEntry.objects.bulk_create(queue_entries)
+        return job
+
     def test_get_jobs_summary(self):
-        job = self._create_job(hosts=xrange(1, 4))
-        entries = list(job.hostqueueentry_set.all())
-        entries[1].status = _hqe_status.FAILED
-        entries[1].save()
-        entries[2].status = _hqe_status.FAILED
-        entries[2].aborted = True
-        entries[2].save()
+        job = self._create_job_with_entries([
+            (1, _hqe_status.QUEUED, False),
+            (2, _hqe_status.FAILED, False),
+            (3, _hqe_status.FAILED, True)])
 
         job_summaries = rpc_interface.get_jobs_summary(id=job.id)
         self.assertEquals(len(job_summaries), 1)
@@ -121,48 +141,6 @@ class RpcInterfaceTest(unittest.TestCase,
         self.assertEquals(summary['status_counts'], {'Queued': 1,
                                                      'Failed': 2})
 
-    def test_get_jobs_filters(self):
-        HqeStatus = models.HostQueueEntry.Status
-
-        def create_two_host_job():
-            return self._create_job(hosts=[1, 2])
-
-        def set_hqe_statuses(job, first_status, second_status):
-            entries = job.hostqueueentry_set.all()
-            entries[0].update_object(status=first_status)
-            entries[1].update_object(status=second_status)
-
-        queued = create_two_host_job()
-
-        queued_and_running = create_two_host_job()
-        set_hqe_statuses(queued_and_running, HqeStatus.QUEUED,
-                         HqeStatus.RUNNING)
-
-        running_and_complete = create_two_host_job()
-        set_hqe_statuses(running_and_complete, HqeStatus.RUNNING,
-                         HqeStatus.COMPLETED)
-
-        complete = create_two_host_job()
-        set_hqe_statuses(complete, HqeStatus.COMPLETED, HqeStatus.COMPLETED)
-
-        started_but_inactive = create_two_host_job()
-        set_hqe_statuses(started_but_inactive, HqeStatus.QUEUED,
-                         HqeStatus.COMPLETED)
-
-        parsing = create_two_host_job()
-        set_hqe_statuses(parsing, HqeStatus.PARSING, HqeStatus.PARSING)
-
-        def check_job_ids(actual_job_dicts, expected_jobs):
-            self.assertEquals(
-                set(job_dict['id'] for job_dict in actual_job_dicts),
-                set(job.id for job in expected_jobs))
-
-        check_job_ids(rpc_interface.get_jobs(not_yet_run=True), [queued])
-        check_job_ids(rpc_interface.get_jobs(running=True),
-                      [queued_and_running, running_and_complete,
-                       started_but_inactive, parsing])
-        check_job_ids(rpc_interface.get_jobs(finished=True), [complete])
-
     def _create_job_helper(self, **kwargs):
         return rpc_interface.create_job('test', 'Medium', 'control file',
                                         'Server', **kwargs)
@@ -188,82 +166,6 @@ class RpcInterfaceTest(unittest.TestCase,
         self.assertEquals(queue_entries[0].meta_host, None)
         self.assertEquals(queue_entries[0].atomic_group, None)
 
-    def _setup_special_tasks(self):
-        host = self.hosts[0]
-
-        job1 = self._create_job(hosts=[1])
-        job2 = self._create_job(hosts=[1])
-
-        entry1 = job1.hostqueueentry_set.all()[0]
-        entry1.update_object(started_on=datetime.datetime(2009, 1, 2),
-                             execution_subdir='host1')
-        entry2 = job2.hostqueueentry_set.all()[0]
-        entry2.update_object(started_on=datetime.datetime(2009, 1, 3),
-                             execution_subdir='host1')
-
-        self.task1 = models.SpecialTask.objects.create(
-            host=host, task=models.SpecialTask.Task.VERIFY,
-            time_started=datetime.datetime(2009, 1, 1),  # ran before job 1
-            is_complete=True, requested_by=models.User.current_user())
-        self.task2 = models.SpecialTask.objects.create(
-            host=host, task=models.SpecialTask.Task.VERIFY,
-            queue_entry=entry2,  # ran with job 2
-            is_active=True, requested_by=models.User.current_user())
-        self.task3 = models.SpecialTask.objects.create(
-            host=host, task=models.SpecialTask.Task.VERIFY,
-            requested_by=models.User.current_user())  # not yet run
-
-    def test_get_special_tasks(self):
-        self._setup_special_tasks()
-        tasks = rpc_interface.get_special_tasks(host__hostname='host1',
-                                                queue_entry__isnull=True)
-        self.assertEquals(len(tasks), 2)
-        self.assertEquals(tasks[0]['task'], models.SpecialTask.Task.VERIFY)
-        self.assertEquals(tasks[0]['is_active'], False)
-        self.assertEquals(tasks[0]['is_complete'], True)
-
-    def test_get_latest_special_task(self):
-        # a particular usage of get_special_tasks()
-        self._setup_special_tasks()
-        self.task2.time_started = datetime.datetime(2009, 1, 2)
-        self.task2.save()
-
-        tasks = rpc_interface.get_special_tasks(
-            host__hostname='host1', task=models.SpecialTask.Task.VERIFY,
-            time_started__isnull=False, sort_by=['-time_started'],
-            query_limit=1)
-        self.assertEquals(len(tasks), 1)
-        self.assertEquals(tasks[0]['id'], 2)
-
-    def _common_entry_check(self, entry_dict):
-        self.assertEquals(entry_dict['host']['hostname'], 'host1')
-        self.assertEquals(entry_dict['job']['id'], 2)
-
-    def test_get_host_queue_entries_and_special_tasks(self):
-        self._setup_special_tasks()
-
-        entries_and_tasks = (
-            rpc_interface.get_host_queue_entries_and_special_tasks('host1'))
-
-        paths = [entry['execution_path'] for entry in entries_and_tasks]
-        self.assertEquals(paths, ['hosts/host1/3-verify',
-                                  '2-autotest_system/host1',
-                                  'hosts/host1/2-verify',
-                                  '1-autotest_system/host1',
-                                  'hosts/host1/1-verify'])
-
-        verify2 = entries_and_tasks[2]
-        self._common_entry_check(verify2)
-        self.assertEquals(verify2['type'], 'Verify')
-        self.assertEquals(verify2['status'], 'Running')
-        self.assertEquals(verify2['execution_path'], 'hosts/host1/2-verify')
-
-        entry2 = entries_and_tasks[1]
-        self._common_entry_check(entry2)
-        self.assertEquals(entry2['type'], 'Job')
-        self.assertEquals(entry2['status'], 'Queued')
-        self.assertEquals(entry2['started_on'], '2009-01-03 00:00:00')
-
     def test_view_invalid_host(self):
         # RPCs used by View Host page should work for invalid hosts
         self._create_job_helper(hosts=[1], profiles=['N/A'])
@@ -291,8 +193,7 @@ class RpcInterfaceTest(unittest.TestCase,
         self.assertEquals(hostname_list, ['host1', 'host2'])
         tasks = rpc_interface.get_special_tasks()
         self.assertEquals(len(tasks), 2)
-        self.assertEquals(set(task['host']['id'] for task in tasks),
-                          set([1, 2]))
+        self.assertEquals(sorted(task['host']['id'] for task in tasks), [1, 2])
 
         task = tasks[0]
         self.assertEquals(task['task'], models.SpecialTask.Task.VERIFY)
@@ -319,34 +220,206 @@ class RpcInterfaceTest(unittest.TestCase,
             parameters=job_parameters, kernel=kernels, label='label1',
             profilers=profilers, profiler_parameters=profiler_parameters,
             profile_only=False, hosts=['host1', ], profiles=['rhel6', ])
-        parameterized_job = models.Job.smart_get(job_id).parameterized_job
+        # Fetch the whole parameterized job graph up front so the checks
+        # below read cached relations instead of querying one at a time.
+        job_query = models.Job.objects.select_related(
+            'parameterized_job__test', 'parameterized_job__label')
+        job_query = job_query.prefetch_related(
+            'parameterized_job__kernels',
+            'parameterized_job__profilers',
+            'parameterized_job__parameterizedjobparameter_set',
+            'parameterized_job__parameterizedjobprofiler_set__'
+            'parameterizedjobprofilerparameter_set')
+        job = job_query.get(pk=job_id)
+        parameterized_job = job.parameterized_job
 
         self.assertEqual(parameterized_job.test, test)
         self.assertEqual(parameterized_job.label, self.labels[0])
-        self.assertEqual(parameterized_job.kernels.count(), 1)
-        self.assertEqual(parameterized_job.profilers.count(), 1)
 
         kernel = models.Kernel.objects.get(**kernels[0])
-        self.assertEqual(parameterized_job.kernels.all()[0], kernel)
-        self.assertEqual(parameterized_job.profilers.all()[0], profiler)
-
-        parameterized_profiler = models.ParameterizedJobProfiler.objects.get(
-            parameterized_job=parameterized_job, profiler=profiler)
-        profiler_parameters_obj = (
-            models.ParameterizedJobProfilerParameter.objects.get(
-                parameterized_job_profiler=parameterized_profiler))
+        self.assertEqual(list(parameterized_job.kernels.all()), [kernel])
+        self.assertEqual(list(parameterized_job.profilers.all()), [profiler])
+
+        parameterized_profilers = (
+            parameterized_job.parameterizedjobprofiler_set.all())
+        self.assertEqual(len(parameterized_profilers), 1)
+        self.assertEqual(parameterized_profilers[0].profiler_id, profiler.id)
+        profiler_parameters_objs = (
+            parameterized_profilers[0].
+            parameterizedjobprofilerparameter_set.all())
+        self.assertEqual(len(profiler_parameters_objs), 1)
+        profiler_parameters_obj = profiler_parameters_objs[0]
         self.assertEqual(profiler_parameters_obj.parameter_name, 'key')
         self.assertEqual(profiler_parameters_obj.parameter_value, 'value')
         self.assertEqual(profiler_parameters_obj.parameter_type, string_type)
 
-        self.assertEqual(
-            parameterized_job.parameterizedjobparameter_set.count(), 1)
-        parameters_obj = (
-            parameterized_job.parameterizedjobparameter_set.all()[0])
-        self.assertEqual(parameters_obj.test_parameter, test_parameter)
+        parameters_objs = (
+            parameterized_job.parameterizedjobparameter_set.all())
+        self.assertEqual(len(parameters_objs), 1)
+        parameters_obj = parameters_objs[0]
+        self.assertEqual(parameters_obj.test_parameter_id, test_parameter.id)
         self.assertEqual(parameters_obj.parameter_value, 'value')
         self.assertEqual(parameters_obj.parameter_type, string_type)
 
 
+class RpcInterfaceJobFiltersTest(test_utils.FrontendClassTestCase):
+
+    def _fill_in_test_data(self):
+        class_data = super(RpcInterfaceJobFiltersTest,
+                           self)._fill_in_test_data()
+
+        # the tests only read these jobs, so they are created once along
+        # with the rest of the class wide test data
+        job_statuses = (
+            ('queued', (_hqe_status.QUEUED, _hqe_status.QUEUED)),
+            ('queued_and_running', (_hqe_status.QUEUED, _hqe_status.RUNNING)),
+            ('running_and_complete', (_hqe_status.RUNNING,
+                                      _hqe_status.COMPLETED)),
+            ('complete', (_hqe_status.COMPLETED, _hqe_status.COMPLETED)),
+            ('started_but_inactive', (_hqe_status.QUEUED,
+                                      _hqe_status.COMPLETED)),
+            ('parsing', (_hqe_status.PARSING, _hqe_status.PARSING)))
+
+        job_ids = {}
+        entry_ids_by_status = {}
+        for name, statuses in job_statuses:
+            job = self._create_job(hosts=[1, 2])
+            job_ids[name] = job.id
+            entries = job.hostqueueentry_set.order_by('id')
+            for entry, status in zip(entries, statuses):
+                entry_ids_by_status.setdefault(status, []).append(entry.id)
+        self._set_hqe_statuses(entry_ids_by_status)
+        class_data['job_ids'] = job_ids
+        return class_data
+
+    def _set_hqe_statuses(self, entry_ids_by_status):
+        """
+        Update the status of many host queue entries at once.
+
+        :param entry_ids_by_status: dict mapping each status to the IDs of
+                the entries that should be set to it.
+        """
+        updates = []
+        for status, entry_ids in entry_ids_by_status.iteritems():
+            active = status in models.HostQueueEntry.ACTIVE_STATUSES
+            complete = status in models.HostQueueEntry.COMPLETE_STATUSES
+            updates.extend((status, active, complete, entry_id)
+                           for entry_id in entry_ids)
+        cursor = connection.cursor()
+        cursor.executemany(
+            'UPDATE %s SET status=%%s, active=%%s, complete=%%s WHERE id=%%s'
+            % models.HostQueueEntry._meta.db_table, updates)
+        transaction.commit_unless_managed()
+
+    def _check_job_ids(self, actual_job_dicts, expected_job_names):
+        self.assertEquals(
+            sorted(job_dict['id'] for job_dict in actual_job_dicts),
+            sorted(self._class_data['job_ids'][name]
+                   for name in expected_job_names))
+
+    def test_get_jobs_not_yet_run(self):
+        self._check_job_ids(rpc_interface.get_jobs(not_yet_run=True),
+                            ['queued'])
+
+    def test_get_jobs_running(self):
+        self._check_job_ids(rpc_interface.get_jobs(running=True),
+                            ['queued_and_running', 'running_and_complete',
+                             'started_but_inactive', 'parsing'])
+
+    def test_get_jobs_finished(self):
+        self._check_job_ids(rpc_interface.get_jobs(finished=True),
+                            ['complete'])
+
+
+class RpcInterfaceSpecialTasksTest(test_utils.FrontendClassTestCase):
+
+    def setUp(self):
+        super(RpcInterfaceSpecialTasksTest, self).setUp()
+        tasks = models.SpecialTask.objects.filter(host=self.hosts[0])
+        self.task1, self.task2, self.task3 = tasks.order_by('id')
+
+    def _fill_in_test_data(self):
+        class_data = super(RpcInterfaceSpecialTasksTest,
+                           self)._fill_in_test_data()
+
+        # created once for the class; tests that modify the tasks are
+        # rolled back by _frontend_test_teardown()
+        host = self.hosts[0]
+
+        job1 = self._create_job(hosts=[1])
+        job2 = self._create_job(hosts=[1])
+
+        entries = models.HostQueueEntry.objects.filter(job__in=[job1, job2])
+        entry1, entry2 = entries.order_by('job')
+        entries.filter(id=entry1.id).update(
+            started_on=datetime.datetime(2009, 1, 2), execution_subdir='host1')
+        entries.filter(id=entry2.id).update(
+            started_on=datetime.datetime(2009, 1, 3), execution_subdir='host1')
+
+        user = models.User.current_user()
+        # bulk_create() doesn't fill in the IDs of the new rows; setUp()
+        # fetches the tasks again for every test
+        models.SpecialTask.objects.bulk_create([
+            models.SpecialTask(
+                host=host, task=models.SpecialTask.Task.VERIFY,
+                time_started=datetime.datetime(2009, 1, 1),  # ran before job 1
+                is_complete=True, requested_by=user),
+            models.SpecialTask(
+                host=host, task=models.SpecialTask.Task.VERIFY,
+                queue_entry=entry2,  # ran with job 2
+                is_active=True, requested_by=user),
+            models.SpecialTask(
+                host=host, task=models.SpecialTask.Task.VERIFY,
+                requested_by=user)])  # not yet run
+        return class_data
+
+    def test_get_special_tasks(self):
+        tasks = rpc_interface.get_special_tasks(host__hostname='host1',
+                                                queue_entry__isnull=True)
+        self.assertEquals(len(tasks), 2)
+        self.assertEquals(tasks[0]['task'], models.SpecialTask.Task.VERIFY)
+        self.assertEquals(tasks[0]['is_active'], False)
+        self.assertEquals(tasks[0]['is_complete'], True)
+
+    def test_get_latest_special_task(self):
+        # a particular usage of get_special_tasks()
+        self.task2.time_started = datetime.datetime(2009, 1, 2)
+        self.task2.save()
+
+        tasks = rpc_interface.get_special_tasks(
+            host__hostname='host1', task=models.SpecialTask.Task.VERIFY,
+            time_started__isnull=False, sort_by=['-time_started'],
+            query_limit=1)
+        self.assertEquals(len(tasks), 1)
+        self.assertEquals(tasks[0]['id'], 2)
+
+    def _common_entry_check(self, entry_dict):
+        self.assertEquals(entry_dict['host']['hostname'], 'host1')
+        self.assertEquals(entry_dict['job']['id'], 2)
+
+    def test_get_host_queue_entries_and_special_tasks(self):
+        entries_and_tasks = (
+            rpc_interface.get_host_queue_entries_and_special_tasks('host1'))
+
+        paths = [entry['execution_path'] for entry in entries_and_tasks]
+        self.assertEquals(paths, ['hosts/host1/3-verify',
+                                  '2-autotest_system/host1',
+                                  'hosts/host1/2-verify',
+                                  '1-autotest_system/host1',
+                                  'hosts/host1/1-verify'])
+
+        verify2 = entries_and_tasks[2]
+        self._common_entry_check(verify2)
+        self.assertEquals(verify2['type'], 'Verify')
+        self.assertEquals(verify2['status'], 'Running')
+        self.assertEquals(verify2['execution_path'], 'hosts/host1/2-verify')
+
+        entry2 = entries_and_tasks[1]
+        self._common_entry_check(entry2)
+        self.assertEquals(entry2['type'], 'Job')
+        self.assertEquals(entry2['status'], 'Queued')
+        self.assertEquals(entry2['started_on'], '2009-01-03 00:00:00')
+
+
 if __name__ == '__main__':
     unittest.main()
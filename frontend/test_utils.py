@@ -1,19 +1,31 @@
 import datetime
+import unittest
 try:
     import autotest.common as common  # pylint: disable=W0611
 except ImportError:
     import common  # pylint: disable=W0611
 from autotest.frontend import setup_test_environment  # pylint: disable=W0611
 from autotest.frontend import thread_local
+from django.db import transaction
 from autotest.frontend.afe import models, model_attributes
 from autotest.client.shared.settings import settings
 from autotest.client.shared.test_utils import mock
 
 
+def _override_test_settings():
+    settings.override_value('AUTOTEST_WEB', 'parameterized_jobs', 'False')
+    settings.override_value('SERVER', 'rpc_logging', 'False')
+
+
 class FrontendTestMixin(object):
 
     def _fill_in_test_data(self):
-        """Populate the test database with some hosts and labels."""
+        """
+        Populate the test database with some hosts and labels.
+
+        :return: dict of extra data that _frontend_class_setup() keeps as
+                cls._class_data, e.g. IDs of rows created by subclasses.
+        """
         if models.DroneSet.drone_sets_enabled():
             models.DroneSet.objects.create(
                 name=models.DroneSet.default_drone_set_name())
@@ -67,11 +79,21 @@ class FrontendTestMixin(object):
             self.hosts[hostnum].labels.add(self.label6)  # a normal label
             self.hosts[hostnum].labels.add(self.label7)
 
+        return {}
+
+    def _load_test_data(self, host_ids, label_ids):
+        """Fetch the rows created by _fill_in_test_data() again by ID."""
+        hosts_by_id = models.Host.objects.in_bulk(host_ids)
+        self.hosts = [hosts_by_id[host_id] for host_id in host_ids]
+        labels_by_id = models.Label.objects.in_bulk(label_ids)
+        self.labels = [labels_by_id[label_id] for label_id in label_ids]
+        (self.label3, self.label4, self.label5, self.label6, self.label7,
+         self.label8) = self.labels[2:8]
+
     def _frontend_common_setup(self, fill_data=True):
         self.god = mock.mock_god(ut=self)
         setup_test_environment.set_up()
-        settings.override_value('AUTOTEST_WEB', 'parameterized_jobs', 'False')
-        settings.override_value('SERVER', 'rpc_logging', 'False')
+        _override_test_settings()
 
         if fill_data:
             self._fill_in_test_data()
@@ -81,6 +103,50 @@ class FrontendTestMixin(object):
         thread_local.set_user(None)
         self.god.unstub_all()
 
+    @classmethod
+    def _frontend_class_setup(cls, fill_data=True):
+        """
+        Create and populate the test database once for a whole test class.
+
+        Use from setUpClass() together with _frontend_test_setup() and
+        _frontend_test_teardown(), which run every test inside a transaction
+        that is rolled back once the test is over.
+        """
+        setup_test_environment.set_up()
+        _override_test_settings()
+
+        cls._test_data_ids = None
+        cls._class_data = {}
+        cls._all_hostnames = frozenset()
+        if fill_data:
+            # _fill_in_test_data() stores what it creates as attributes, so
+            # run it on a bare instance and keep only the IDs around
+            test_data = cls.__new__(cls)
+            cls._class_data = test_data._fill_in_test_data()
+            cls._test_data_ids = ([host.id for host in test_data.hosts],
+                                  [label.id for label in test_data.labels])
+            cls._all_hostnames = frozenset(host.hostname
+                                           for host in test_data.hosts)
+
+    @classmethod
+    def _frontend_class_teardown(cls):
+        setup_test_environment.tear_down()
+
+    def _frontend_test_setup(self):
+        self.god = mock.mock_god(ut=self)
+        _override_test_settings()
+
+        transaction.enter_transaction_management()
+        transaction.managed(True)
+        if self._test_data_ids:
+            self._load_test_data(*self._test_data_ids)
+
+    def _frontend_test_teardown(self):
+        transaction.rollback()
+        transaction.leave_transaction_management()
+        thread_local.set_user(None)
+        self.god.unstub_all()
+
     def _create_job(self, hosts=[], metahosts=[], priority=0, active=False,
                     synchronous=False, atomic_group=None, hostless=False,
                     drone_set=None, control_file='control',
@@ -152,3 +218,32 @@ class FrontendTestMixin(object):
             args['hosts'] = hosts
         return self._create_job(priority=priority, active=active,
                                 drone_set=drone_set, **args)
+
+
+class FrontendClassTestCase(unittest.TestCase, FrontendTestMixin):
+
+    """
+    Test case that creates the test database once per class and rolls back
+    the changes of every test.
+
+    Subclasses can override _fill_in_test_data() to add data shared by all
+    their tests.
+    """
+
+    # don't set _multiprocess_can_split_: tearDownClass() drops the test
+    # database, so with nose's --processes every class has to run as one
+    # unit within a single worker
+
+    @classmethod
+    def setUpClass(cls):
+        cls._frontend_class_setup()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._frontend_class_teardown()
+
+    def setUp(self):
+        self._frontend_test_setup()
+
+    def tearDown(self):
+        self._frontend_test_teardown()
@@ -13,12 +13,101 @@ You should import the "hosts" package instead of importing each type of host.
 import logging
 import os
 import re
+import select
+import socket
 import subprocess
+import threading
+import time
 
 from autotest.client.shared import error, ssh_key
+from autotest.client.shared.settings import settings
 from autotest.server import utils
 from autotest.server.hosts import abstract_ssh
 
+enable_persistent_ssh = settings.get_value('AUTOSERV', 'enable_persistent_ssh',
+                                           type=bool, default=False)
+use_sshagent_with_paramiko = settings.get_value(
+    'AUTOSERV', 'use_sshagent_with_paramiko', type=bool, default=True)
+
+# imported by _load_paramiko() once a persistent connection is needed, so
+# that runs without enable_persistent_ssh don't load it at all
+paramiko = None
+
+_SSH_TIMEOUT_RE = re.compile(r'^ssh: connect to host .* port .*: '
+                             r'Connection timed out\r$', re.M)
+
+_CHANNEL_READ_SIZE = 32768
+
+_MAX_CACHED_REGEXPS = 256
+_regexp_cache = {}
+
+
+def _compile_regexp(regexp):
+    """
+    Compile regexp, reusing the pattern object of previous calls.
+    """
+    pattern = _regexp_cache.get(regexp)
+    if pattern is None:
+        if len(_regexp_cache) >= _MAX_CACHED_REGEXPS:
+            _regexp_cache.clear()
+        pattern = _regexp_cache[regexp] = re.compile(regexp)
+    return pattern
+
+
+def _load_paramiko():
+    """
+    Import paramiko on first use.
+
+    :return: False if paramiko is not installed.
+    """
+    global paramiko
+    if paramiko is None:
+        try:
+            import paramiko
+        except ImportError:
+            return False
+    return True
+
+
+class _EnvDict(dict):
+
+    """
+    dict that counts its modifications in the version attribute, so values
+    derived from its contents can be cached.
+    """
+
+    # a class attribute, since unpickling adds the items through
+    # __setitem__() before the instance dict is restored
+    version = 0
+
+    def __setitem__(self, key, value):
+        super(_EnvDict, self).__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super(_EnvDict, self).__delitem__(key)
+        self.version += 1
+
+    def clear(self):
+        super(_EnvDict, self).clear()
+        self.version += 1
+
+    def pop(self, *args):
+        self.version += 1
+        return super(_EnvDict, self).pop(*args)
+
+    def popitem(self):
+        self.version += 1
+        return super(_EnvDict, self).popitem()
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return super(_EnvDict, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super(_EnvDict, self).update(*args, **kwargs)
+        self.version += 1
+
 
 class SSHHost(abstract_ssh.AbstractSSHHost):
 
@@ -51,12 +140,17 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
                 hostname: network hostname or address of remote machine
         """
         super(SSHHost, self)._initialize(hostname=hostname, *args, **dargs)
-        self.setup_ssh()
+        self._ssh_cmd_cache = {}
+        self._default_ssh_cmd = (self.master_ssh_option,
+                                 self._build_ssh_command(30, '', 300))
+        self._persistent_client = None
+        self._persistent_pid = None
+        self._persistent_disabled = not enable_persistent_ssh
+        # only password based logins need any ssh setup
+        if self.password:
+            self.setup_ssh()
 
-    def ssh_command(self, connect_timeout=30, options='', alive_interval=300):
-        """
-        Construct an ssh command with proper args for this host.
-        """
+    def _build_ssh_command(self, connect_timeout, options, alive_interval):
         options = "%s %s" % (options, self.master_ssh_option)
         base_cmd = abstract_ssh.make_ssh_command(user=self.user, port=self.port,
                                                  opts=options,
@@ -65,6 +159,52 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
                                                  alive_interval=alive_interval)
         return "%s %s" % (base_cmd, self.hostname)
 
+    def ssh_command(self, connect_timeout=30, options='', alive_interval=300):
+        """
+        Construct an ssh command with proper args for this host.
+        """
+        # nearly every caller uses the defaults, so keep that command ready
+        # for as long as the master ssh option it was built with is current
+        if connect_timeout == 30 and options == '' and alive_interval == 300:
+            master_ssh_option, ssh_cmd = self._default_ssh_cmd
+            if master_ssh_option == self.master_ssh_option:
+                return ssh_cmd
+            ssh_cmd = self._build_ssh_command(30, '', 300)
+            self._default_ssh_cmd = (self.master_ssh_option, ssh_cmd)
+            return ssh_cmd
+
+        # the master ssh option changes whenever the master connection is
+        # (re)started, so it is part of the cache key as well
+        key = (connect_timeout, options, alive_interval, self.master_ssh_option)
+        ssh_cmd = self._ssh_cmd_cache.get(key)
+        if ssh_cmd is None:
+            ssh_cmd = self._build_ssh_command(connect_timeout, options,
+                                              alive_interval)
+            self._ssh_cmd_cache[key] = ssh_cmd
+        return ssh_cmd
+
+    def _get_env(self):
+        return self._env
+
+    def _set_env(self, env):
+        self._env = _EnvDict(env)
+        self._env_string_cache = (None, "")
+
+    env = property(_get_env, _set_env)
+
+    def _env_string(self):
+        """
+        Return the host environment as space separated NAME=value pairs.
+
+        The string is only rebuilt after the environment was modified.
+        """
+        version, env_string = self._env_string_cache
+        if version != self._env.version:
+            env_string = " ".join("=".join(pair)
+                                  for pair in self._env.iteritems())
+            self._env_string_cache = (self._env.version, env_string)
+        return env_string
+
     def _run(self, command, timeout, ignore_status, stdout, stderr,
              connect_timeout, env, options, stdin, args):
         """Helper function for run()."""
@@ -73,8 +213,8 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
             env = ""
         else:
             env = "export %s;" % env
-        for arg in args:
-            command += ' "%s"' % utils.sh_escape(arg)
+        if args:
+            command += "".join(' "%s"' % utils.sh_escape(arg) for arg in args)
         full_cmd = '%s "%s %s"' % (ssh_cmd, env, utils.sh_escape(command))
         result = utils.run(full_cmd, timeout, True, stdout, stderr,
                            verbose=False, stdin=stdin,
@@ -86,8 +226,7 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
         # any command.  Since the following 2 errors have to do with
         # connecting, it's safe to do these checks.
         if result.exit_status == 255:
-            if re.search(r'^ssh: connect to host .* port .*: '
-                         r'Connection timed out\r$', result.stderr):
+            if _SSH_TIMEOUT_RE.search(result.stderr):
                 raise error.AutoservSSHTimeout("ssh timed out", result)
             if "Permission denied." in result.stderr:
                 msg = "ssh permission denied"
@@ -118,7 +257,7 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
         # Start a master SSH connection if necessary.
         self.start_master_ssh()
 
-        env = " ".join("=".join(pair) for pair in self.env.iteritems())
+        env = self._env_string()
         try:
             return self._run(command, timeout, ignore_status, stdout_tee,
                              stderr_tee, connect_timeout, env, options,
@@ -128,6 +267,208 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
             # Catch that and stuff it into AutoservRunError and raise it.
             raise error.AutoservRunError(cmderr.args[0], cmderr.args[1])
 
+    def _get_persistent_client(self, connect_timeout):
+        """
+        Return a connected paramiko client for this host, or None if the
+        persistent connection is disabled or could not be established.
+        """
+        if self._persistent_client is not None:
+            transport = self._persistent_client.get_transport()
+            if (self._persistent_pid == os.getpid() and transport is not None
+                    and transport.is_active()):
+                return self._persistent_client
+            self._close_persistent_client()
+
+        if self._persistent_disabled:
+            return None
+        if not _load_paramiko():
+            self._persistent_disabled = True
+            return None
+
+        client = paramiko.SSHClient()
+        # same as StrictHostKeyChecking=no with a throwaway known hosts file
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            client.connect(self.hostname, port=self.port, username=self.user,
+                           password=self.password or None,
+                           timeout=connect_timeout,
+                           allow_agent=use_sshagent_with_paramiko)
+        except (socket.error, paramiko.SSHException, EOFError), e:
+            logging.debug("Persistent ssh connection to %s failed (%s), "
+                          "using the ssh command from now on", self.hostname, e)
+            self._persistent_disabled = True
+            return None
+        client.get_transport().set_keepalive(300)
+        self._persistent_client = client
+        self._persistent_pid = os.getpid()
+        return client
+
+    def _close_persistent_client(self):
+        # paramiko hangs joining its thread after a fork, so a client
+        # inherited from the parent process is just dropped
+        if (self._persistent_client is not None and
+                self._persistent_pid == os.getpid()):
+            self._persistent_client.close()
+        self._persistent_client = None
+        self._persistent_pid = None
+
+    def _run_via_persistent(self, command, timeout, ignore_status=False,
+                            stdout_tee=utils.TEE_TO_LOGS,
+                            stderr_tee=utils.TEE_TO_LOGS, connect_timeout=30,
+                            options='', stdin=None, verbose=True, args=()):
+        """
+        Run a short command over the persistent connection to the host.
+
+        The output of the command is buffered in memory, so this is only
+        meant for commands with little output. Falls back to run() when
+        the persistent connection is not available, the command could not
+        be started on it, or the call needs ssh options or stdin.
+
+        :raise AutoservRunError: if the command failed or timed out
+        """
+        client = None
+        if not options and stdin is None:
+            client = self._get_persistent_client(connect_timeout)
+        if client is None:
+            return self.run(command, timeout=timeout,
+                            ignore_status=ignore_status,
+                            stdout_tee=stdout_tee, stderr_tee=stderr_tee,
+                            connect_timeout=connect_timeout, options=options,
+                            stdin=stdin, verbose=verbose, args=args)
+
+        if args:
+            command += "".join(' "%s"' % utils.sh_escape(arg) for arg in args)
+        if verbose:
+            logging.debug("Running (persistent ssh) '%s'" % command)
+
+        env = self._env_string()
+        if env.strip():
+            full_cmd = "export %s; %s" % (env, command)
+        else:
+            full_cmd = command
+
+        start_time = time.time()
+        try:
+            channel = self._start_persistent_command(client, full_cmd,
+                                                     timeout)
+        except (socket.error, paramiko.SSHException, EOFError), e:
+            # the command never started, so it is safe to run it again
+            # with the ssh command
+            logging.debug("Persistent ssh session to %s failed (%s), "
+                          "retrying with the ssh command", self.hostname, e)
+            self._close_persistent_client()
+            return self.run(command, timeout=timeout,
+                            ignore_status=ignore_status,
+                            stdout_tee=stdout_tee, stderr_tee=stderr_tee,
+                            connect_timeout=connect_timeout, verbose=False)
+        if channel is None:
+            # the connection is most likely dead, don't reuse it
+            self._close_persistent_client()
+            result = utils.CmdResult(command)
+            result.duration = time.time() - start_time
+            raise error.AutoservRunError("command timed out", result)
+
+        stdout_tee = utils.get_stream_tee_file(
+            stdout_tee, utils.DEFAULT_STDOUT_LEVEL,
+            prefix=utils.STDOUT_PREFIX)
+        stderr_tee = utils.get_stream_tee_file(
+            stderr_tee, utils.get_stderr_level(ignore_status),
+            prefix=utils.STDERR_PREFIX)
+        result = utils.CmdResult(command)
+        try:
+            timed_out = not self._read_channel(channel, start_time + timeout,
+                                               stdout_tee, stderr_tee, result)
+        except (socket.error, paramiko.SSHException, EOFError), e:
+            self._close_persistent_client()
+            result.duration = time.time() - start_time
+            raise error.AutoservRunError("ssh failed: %s" % e, result)
+        finally:
+            stdout_tee.flush()
+            stderr_tee.flush()
+        result.duration = time.time() - start_time
+        if timed_out:
+            channel.close()
+            raise error.AutoservRunError("command timed out", result)
+
+        # paramiko reports -1 when the server sent no exit status, e.g.
+        # if the command was killed by a signal; ssh itself exits with 255
+        result.exit_status = channel.recv_exit_status()
+        if result.exit_status == -1:
+            result.exit_status = 255
+        channel.close()
+
+        if not ignore_status and result.exit_status > 0:
+            raise error.AutoservRunError("command execution error", result)
+        return result
+
+    def _start_persistent_command(self, client, command, timeout):
+        """
+        Open a session on the persistent connection and start command on it.
+
+        paramiko waits for the server to answer until the transport dies,
+        which can take as long as the keepalive interval, so this is done
+        in a helper thread that is given up on after timeout seconds.
+
+        :return: the channel command runs on, or None if the timeout passed
+                first.
+        """
+        outcome = []
+
+        def start():
+            try:
+                channel = client.get_transport().open_session()
+                channel.exec_command(command)
+                outcome.append((channel, None))
+            except Exception, e:
+                outcome.append((None, e))
+
+        starter = threading.Thread(target=start)
+        starter.daemon = True
+        starter.start()
+        starter.join(timeout)
+        if not outcome:
+            return None
+        channel, exc = outcome[0]
+        if exc is not None:
+            raise exc
+        return channel
+
+    def _read_channel(self, channel, deadline, stdout_tee, stderr_tee, result):
+        """
+        Read stdout and stderr of a command running on channel into result
+        until it exits.
+
+        Both streams are drained as data arrives so that a command writing
+        a lot to one of them can't stall on a full channel window.
+
+        :return: False if the deadline passed before the command exited.
+        """
+        stdout, stderr = [], []
+        while True:
+            if channel.recv_ready():
+                data = channel.recv(_CHANNEL_READ_SIZE)
+                stdout.append(data)
+                stdout_tee.write(data)
+            elif channel.recv_stderr_ready():
+                data = channel.recv_stderr(_CHANNEL_READ_SIZE)
+                stderr.append(data)
+                stderr_tee.write(data)
+            elif channel.exit_status_ready():
+                break
+            else:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                if channel.eof_received:
+                    # the channel stays readable after EOF, so select()
+                    # would return at once; wait for the exit status
+                    channel.status_event.wait(remaining)
+                else:
+                    select.select([channel], [], [], remaining)
+        result.stdout = "".join(stdout)
+        result.stderr = "".join(stderr)
+        return channel.exit_status_ready()
+
     def run_short(self, command, **kwargs):
         """
         Calls the run() command with a short default timeout.
@@ -137,8 +478,12 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
                 with the exception of the timeout argument which
                 here is fixed at 60 seconds.
                 It returns the result of run.
+
+        If enable_persistent_ssh is set, the command is sent over a
+        connection that stays open between calls instead of starting a
+        new ssh process.
         """
-        return self.run(command, timeout=60, **kwargs)
+        return self._run_via_persistent(command, timeout=60, **kwargs)
 
     def run_grep(self, command, timeout=30, ignore_status=False,
                  stdout_ok_regexp=None, stdout_err_regexp=None,
@@ -180,15 +525,14 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
         """
 
         # We ignore the status, because we will handle it at the end.
-        result = self.run(command, timeout, ignore_status=True,
-                          connect_timeout=connect_timeout)
+        result = self._run_via_persistent(command, timeout, ignore_status=True,
+                                          connect_timeout=connect_timeout)
 
         # Look for the patterns, in order
         for (regexp, stream) in ((stderr_err_regexp, result.stderr),
                                  (stdout_err_regexp, result.stdout)):
             if regexp and stream:
-                err_re = re.compile(regexp)
-                if err_re.search(stream):
+                if _compile_regexp(regexp).search(stream):
                     raise error.AutoservRunError(
                         '%s failed, found error pattern: "%s"' % (command,
                                                                   regexp), result)
@@ -196,14 +540,24 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
         for (regexp, stream) in ((stderr_ok_regexp, result.stderr),
                                  (stdout_ok_regexp, result.stdout)):
             if regexp and stream:
-                ok_re = re.compile(regexp)
-                if ok_re.search(stream):
-                    if ok_re.search(stream):
-                        return
+                if _compile_regexp(regexp).search(stream):
+                    return
 
         if not ignore_status and result.exit_status > 0:
             raise error.AutoservRunError("command execution error", result)
 
+    def close(self):
+        super(SSHHost, self).close()
+        self._close_persistent_client()
+
+    def reboot_followup(self, *args, **dargs):
+        super(SSHHost, self).reboot_followup(*args, **dargs)
+        # the temporary directories AsyncSSHMixin sent run_helper.py to may
+        # be gone after a reboot
+        self._run_helper_dir = None
+        # the persistent connection died with the old boot
+        self._close_persistent_client()
+
     def setup_ssh(self):
         if self.password:
             try:
@@ -215,6 +569,10 @@ class SSHHost(abstract_ssh.AbstractSSHHost):
 
 class AsyncSSHMixin(object):
 
+    # remote directory run_helper.py was last sent to, reset by
+    # SSHHost.reboot_followup()
+    _run_helper_dir = None
+
     def __init__(self, *args, **kwargs):
         super(AsyncSSHMixin, self).__init__(*args, **kwargs)
 
@@ -234,26 +592,27 @@ class AsyncSSHMixin(object):
         # Start a master SSH connection if necessary.
         self.start_master_ssh()
         run_helper_path = self.job.tmpdir
-        # Create directory for run_helper.py
-        self.run("mkdir -p %s" % run_helper_path)
-        self.send_file(os.path.join(self.job.clientdir, "shared", "hosts",
-                                    "scripts", "run_helper.py"),
-                       os.path.join(run_helper_path, "run_helper.py"))
+        if self._run_helper_dir != run_helper_path:
+            # Create directory for run_helper.py
+            self.run("mkdir -p %s" % run_helper_path)
+            self.send_file(os.path.join(self.job.clientdir, "shared", "hosts",
+                                        "scripts", "run_helper.py"),
+                           os.path.join(run_helper_path, "run_helper.py"))
+            self._run_helper_dir = run_helper_path
 
-        env = " ".join("=".join(pair) for pair in self.env.iteritems())
+        env = self._env_string()
 
         ssh_cmd = self.ssh_command(connect_timeout, options)
         if not env.strip():
             env = ""
         else:
             env = "export %s;" % env
-        for arg in args:
-            command += ' "%s"' % utils.sh_escape(arg)
-        full_cmd = '{ssh_cmd} "{env} {cmd}"'.format(
-            ssh_cmd=ssh_cmd, env=env,
-            cmd=utils.sh_escape("%s (%s '%s')" % (cmd_outside_subshell,
-                                                  os.path.join(run_helper_path, "run_helper.py"),
-                                                  utils.sh_escape(command))))
+        if args:
+            command += "".join(' "%s"' % utils.sh_escape(arg) for arg in args)
+        run_helper = os.path.join(run_helper_path, "run_helper.py")
+        remote_cmd = "%s (%s '%s')" % (cmd_outside_subshell, run_helper,
+                                       utils.sh_escape(command))
+        full_cmd = '%s "%s %s"' % (ssh_cmd, env, utils.sh_escape(remote_cmd))
 
         job = utils.AsyncJob(full_cmd, stdout_tee=stdout_tee,
                              stderr_tee=stderr_tee, verbose=verbose,
@@ -0,0 +1,460 @@
+#!/usr/bin/python
+
+import cPickle
+import os
+import socket
+import threading
+import time
+import unittest
+try:
+    import autotest.common as common  # pylint: disable=W0611
+except ImportError:
+    import common  # pylint: disable=W0611
+
+from autotest.client.shared import error
+from autotest.client.shared.test_utils import mock
+from autotest.server.hosts import ssh_host
+
+
+class _FakeSSHException(Exception):
+    pass
+
+
+class _FakeParamiko(object):
+
+    SSHException = _FakeSSHException
+
+    def __init__(self):
+        self.clients = []
+
+    def SSHClient(self):
+        client = _FakeClient(_FakeChannel())
+        self.clients.append(client)
+        return client
+
+    def AutoAddPolicy(self):
+        return None
+
+
+class _FakeChannel(object):
+
+    def __init__(self, stdout='', stderr='', exit_status=0, exits=True):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.exit_status = exit_status
+        self.exits = exits
+        self.command = None
+        self.closed = False
+        self.eof_received = False
+        self.status_event = _FakeEvent(self)
+
+    def exec_command(self, command):
+        self.command = command
+
+    def recv_ready(self):
+        return bool(self.stdout)
+
+    def recv(self, size):
+        data, self.stdout = self.stdout[:size], self.stdout[size:]
+        return data
+
+    def recv_stderr_ready(self):
+        return bool(self.stderr)
+
+    def recv_stderr(self, size):
+        data, self.stderr = self.stderr[:size], self.stderr[size:]
+        return data
+
+    def exit_status_ready(self):
+        return self.exits
+
+    def recv_exit_status(self):
+        return self.exit_status
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeEvent(object):
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.waits = 0
+        self.exits_on_wait = True
+
+    def wait(self, timeout):
+        self.waits += 1
+        if self.exits_on_wait:
+            # the exit status shows up while waiting for it
+            self.channel.exits = True
+        else:
+            time.sleep(timeout)
+
+
+class _FakeTransport(object):
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.session_error = None
+        self.session_hangs = False
+        self.closed = threading.Event()
+
+    def open_session(self):
+        if self.session_error:
+            raise self.session_error
+        if self.session_hangs:
+            # like paramiko, wait until the transport is closed
+            self.closed.wait(10)
+            raise EOFError()
+        return self.channel
+
+    def is_active(self):
+        return True
+
+    def set_keepalive(self, interval):
+        pass
+
+
+class _FakeClient(object):
+
+    def __init__(self, channel):
+        self.transport = _FakeTransport(channel)
+        self.connect_error = None
+        self.connect_dargs = None
+        self.closed = False
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, *args, **dargs):
+        self.connect_dargs = dargs
+        if self.connect_error:
+            raise self.connect_error
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+        self.transport.closed.set()
+
+
+class _FakeTee(object):
+
+    def __init__(self):
+        self.data = ''
+        self.flushed = False
+
+    def write(self, data):
+        self.data += data
+
+    def flush(self):
+        self.flushed = True
+
+
+class test_ssh_host_persistent(unittest.TestCase):
+
+    def setUp(self):
+        self.god = mock.mock_god()
+        self.paramiko = _FakeParamiko()
+        self.god.stub_with(ssh_host, 'paramiko', self.paramiko)
+
+        self.host = ssh_host.SSHHost.__new__(ssh_host.SSHHost)
+        self.host._initialize(hostname='localhost')
+        self.host._persistent_disabled = False
+
+        self.run_calls = []
+        self.host.run = lambda *args, **dargs: self.run_calls.append(
+            (args, dargs))
+
+    def tearDown(self):
+        self.host.close()
+        self.god.unstub_all()
+
+    def _set_channel(self, channel):
+        client = _FakeClient(channel)
+        self.host._persistent_client = client
+        self.host._persistent_pid = os.getpid()
+        return client
+
+    def test_disabled_uses_run(self):
+        self.host._persistent_disabled = True
+        self.host.run_short('ls')
+        self.assertEqual(len(self.run_calls), 1)
+        self.assertEqual(self.paramiko.clients, [])
+
+    def test_missing_paramiko_disables(self):
+        self.god.stub_with(ssh_host, '_load_paramiko', lambda: False)
+        self.host.run_short('ls')
+        self.host.run_short('ls')
+        self.assertEqual(len(self.run_calls), 2)
+        self.assertTrue(self.host._persistent_disabled)
+        self.assertEqual(self.paramiko.clients, [])
+
+    def test_options_and_stdin_use_run(self):
+        channel = _FakeChannel()
+        self._set_channel(channel)
+        self.host.run_short('ls', options='-N')
+        self.host.run_short('cat', stdin='data')
+        self.assertEqual(len(self.run_calls), 2)
+        self.assertEqual(channel.command, None)
+
+    def test_connect_failure_disables(self):
+        client = _FakeClient(_FakeChannel())
+        client.connect_error = socket.error('refused')
+        self.paramiko.SSHClient = lambda: client
+        self.host.run_short('ls')
+        self.host.run_short('ls')
+        self.assertEqual(len(self.run_calls), 2)
+        self.assertTrue(self.host._persistent_disabled)
+
+    def test_session_failure_uses_run(self):
+        client = self._set_channel(_FakeChannel())
+        client.transport.session_error = _FakeSSHException('closed')
+        self.host.run_short('ls')
+        self.assertEqual(len(self.run_calls), 1)
+        self.assertTrue(client.closed)
+        self.assertEqual(self.host._persistent_client, None)
+
+    def test_success(self):
+        channel = _FakeChannel(stdout='out', stderr='err')
+        self._set_channel(channel)
+        stdout_tee, stderr_tee = _FakeTee(), _FakeTee()
+        result = self.host.run_short('ls', args=('a b',),
+                                     stdout_tee=stdout_tee,
+                                     stderr_tee=stderr_tee)
+        self.assertEqual(channel.command, 'ls "a b"')
+        self.assertEqual(result.exit_status, 0)
+        self.assertEqual(result.stdout, 'out')
+        self.assertEqual(result.stderr, 'err')
+        self.assertEqual(stdout_tee.data, 'out')
+        self.assertEqual(stderr_tee.data, 'err')
+        self.assertTrue(stdout_tee.flushed)
+        self.assertTrue(stderr_tee.flushed)
+        self.assertEqual(self.run_calls, [])
+
+    def test_failure_raises(self):
+        self._set_channel(_FakeChannel(exit_status=1))
+        self.assertRaises(error.AutoservRunError, self.host.run_short, 'false')
+
+    def test_failure_ignored(self):
+        self._set_channel(_FakeChannel(exit_status=1))
+        result = self.host.run_short('false', ignore_status=True)
+        self.assertEqual(result.exit_status, 1)
+
+    def test_missing_exit_status_raises(self):
+        self._set_channel(_FakeChannel(exit_status=-1))
+        try:
+            self.host.run_short('kill -9 $$')
+        except error.AutoservRunError, e:
+            self.assertEqual(e.result_obj.exit_status, 255)
+        else:
+            self.fail('AutoservRunError not raised')
+
+    def test_connect_follows_sshagent_setting(self):
+        self.god.stub_with(ssh_host, 'use_sshagent_with_paramiko', False)
+        self.host.run_short('ls')
+        client = self.paramiko.clients[0]
+        self.assertEqual(client.connect_dargs['allow_agent'], False)
+
+    def test_eof_waits_for_exit_status(self):
+        channel = _FakeChannel(stdout='out', exits=False)
+        channel.eof_received = True
+        self._set_channel(channel)
+        result = self.host.run_short('ls')
+        self.assertEqual(result.stdout, 'out')
+        self.assertEqual(channel.status_event.waits, 1)
+
+    def test_timeout_raises(self):
+        channel = _FakeChannel(exits=False)
+        channel.eof_received = True
+        channel.status_event.exits_on_wait = False
+        self._set_channel(channel)
+        self.assertRaises(error.AutoservRunError,
+                          self.host._run_via_persistent, 'sleep 100',
+                          timeout=0.1, ignore_status=True)
+        self.assertTrue(channel.closed)
+
+    def test_session_timeout_raises(self):
+        channel = _FakeChannel()
+        client = self._set_channel(channel)
+        client.transport.session_hangs = True
+        self.assertRaises(error.AutoservRunError,
+                          self.host._run_via_persistent, 'ls', timeout=0.1)
+        self.assertTrue(client.closed)
+        self.assertEqual(self.host._persistent_client, None)
+        self.assertEqual(channel.command, None)
+        self.assertEqual(self.run_calls, [])
+
+    def test_reboot_reconnects(self):
+        old_client = self._set_channel(_FakeChannel())
+        self.host.reboot_followup()
+        self.assertTrue(old_client.closed)
+        self.host.run_short('ls')
+        self.assertEqual(self.host._persistent_client,
+                         self.paramiko.clients[0])
+
+    def test_client_inherited_after_fork_is_dropped(self):
+        inherited = self._set_channel(_FakeChannel())
+        self.host._persistent_pid = os.getpid() + 1
+        self.host.run_short('ls')
+        self.assertFalse(inherited.closed)
+        self.assertEqual(self.host._persistent_client,
+                         self.paramiko.clients[0])
+        self.assertEqual(self.host._persistent_pid, os.getpid())
+
+
+class test_ssh_host_env(unittest.TestCase):
+
+    def setUp(self):
+        self.host = ssh_host.SSHHost.__new__(ssh_host.SSHHost)
+        self.host._initialize(hostname='localhost')
+        self.host.env['A'] = '1'
+        self.assertEqual(self.host._env_string(), 'A=1')
+
+    def tearDown(self):
+        self.host.close()
+
+    def _check_env_string(self, expected):
+        self.assertEqual(sorted(self.host._env_string().split()), expected)
+
+    def test_setitem(self):
+        self.host.env['B'] = '2'
+        self._check_env_string(['A=1', 'B=2'])
+
+    def test_update(self):
+        self.host.env.update(B='2')
+        self._check_env_string(['A=1', 'B=2'])
+
+    def test_setdefault(self):
+        self.host.env.setdefault('B', '2')
+        self._check_env_string(['A=1', 'B=2'])
+
+    def test_pop(self):
+        self.host.env.pop('A')
+        self._check_env_string([])
+
+    def test_popitem(self):
+        self.host.env.popitem()
+        self._check_env_string([])
+
+    def test_delitem(self):
+        del self.host.env['A']
+        self._check_env_string([])
+
+    def test_clear(self):
+        self.host.env.clear()
+        self._check_env_string([])
+
+    def test_reassign(self):
+        self.host.env = {'B': '2'}
+        self._check_env_string(['B=2'])
+
+    def test_pickle(self):
+        for protocol in (0, 2):
+            env = cPickle.loads(cPickle.dumps(self.host.env, protocol))
+            self.assertEqual(env, {'A': '1'})
+            version = env.version
+            env['B'] = '2'
+            self.assertNotEqual(env.version, version)
+
+
+class test_ssh_host_ssh_command(unittest.TestCase):
+
+    def setUp(self):
+        self.host = ssh_host.SSHHost.__new__(ssh_host.SSHHost)
+        self.host._initialize(hostname='localhost')
+
+    def tearDown(self):
+        self.host.close()
+
+    def test_default_command_follows_master_ssh_option(self):
+        self.assertFalse('ControlPath' in self.host.ssh_command())
+        self.host.master_ssh_option = '-o ControlPath=/tmp/master/socket'
+        self.assertTrue('-o ControlPath=/tmp/master/socket' in
+                        self.host.ssh_command())
+        self.host.master_ssh_option = ''
+        self.assertFalse('ControlPath' in self.host.ssh_command())
+
+    def test_default_command_matches_explicit_defaults(self):
+        self.host.master_ssh_option = '-o ControlPath=/tmp/master/socket'
+        self.assertEqual(self.host.ssh_command(),
+                         self.host._build_ssh_command(30, '', 300))
+        self.assertNotEqual(self.host.ssh_command(options='-N'),
+                            self.host.ssh_command())
+
+
+
+class _AsyncSSHHost(ssh_host.SSHHost, ssh_host.AsyncSSHMixin):
+    pass
+
+
+class _FakeAsyncJob(object):
+
+    def __init__(self, command, **dargs):
+        self.command = command
+
+
+class _FakeProfilers(object):
+
+    def handle_reboot(self, host):
+        pass
+
+
+class _FakeJob(object):
+
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        self.clientdir = '/usr/local/autotest/client'
+        self.hosts = set()
+        self.profilers = _FakeProfilers()
+
+
+class test_ssh_host_run_async(unittest.TestCase):
+
+    def setUp(self):
+        self.god = mock.mock_god()
+        self.god.stub_with(ssh_host.utils, 'AsyncJob', _FakeAsyncJob)
+
+        self.host = _AsyncSSHHost.__new__(_AsyncSSHHost)
+        self.host._initialize(hostname='localhost')
+        self.host.job = _FakeJob('/tmp/job1')
+
+        self.run_calls = []
+        self.sent_files = []
+        self.host.run = lambda command, **dargs: self.run_calls.append(
+            command)
+        self.host.send_file = lambda source, dest: self.sent_files.append(
+            dest)
+        self.host.start_master_ssh = lambda: None
+        self.host.ssh_command = lambda *args: 'ssh localhost'
+
+    def tearDown(self):
+        self.host.close()
+        self.god.unstub_all()
+
+    def _check_deploys(self, dirs):
+        self.assertEqual(self.run_calls, ['mkdir -p %s' % d for d in dirs])
+        self.assertEqual(self.sent_files,
+                         ['%s/run_helper.py' % d for d in dirs])
+
+    def test_deploys_once(self):
+        self.host.run_async('true')
+        self.host.run_async('true')
+        self._check_deploys(['/tmp/job1'])
+
+    def test_redeploys_to_new_dir(self):
+        self.host.run_async('true')
+        self.host.job = _FakeJob('/tmp/job2')
+        self.host.run_async('true')
+        self._check_deploys(['/tmp/job1', '/tmp/job2'])
+
+    def test_redeploys_after_reboot(self):
+        self.host.run_async('true')
+        self.host.reboot_followup()
+        self.host.run_async('true')
+        self._check_deploys(['/tmp/job1', '/tmp/job1'])
+
+
+if __name__ == "__main__":
+    unittest.main()